@@ -1,61 +1,72 @@
 import numpy as np
 import itertools
+import functools
+import operator
 import time
 
+ROWS = [tuple((r, c) for c in range(9)) for r in range(9)]
+COLS = [tuple((r, c) for r in range(9)) for c in range(9)]
+BOXES = [tuple((r, c) for r in range(br*3, br*3+3) for c in range(bc*3, bc*3+3)) for br in range(3) for bc in range(3)]
+UNITS = ROWS + COLS + BOXES
+BOX_INDEX = np.array([[(r // 3)*3 + c // 3 for c in range(9)] for r in range(9)])
+CELL_UNITS = {(r, c): (r, 9 + c, 18 + (r // 3)*3 + c // 3) for r in range(9) for c in range(9)}
+PEERS = {(r, c): frozenset(ROWS[r] + COLS[c] + BOXES[(r // 3)*3 + c // 3]) - {(r, c)} for r in range(9) for c in range(9)}
+
+def get_mask_values(mask):
+    """Returns the values whose bits are set in the candidate bitmask `mask`"""
+    return [i for i in range(1, 10) if mask >> (i-1) & 1]
+
 class Sudoku:
     def __init__(self, file_name):
-        self.board = np.genfromtxt(fname=file_name, delimiter=',', dtype='int8')
+        with open(file_name) as f:
+            data = f.read().replace('\n', ',').split(',')
+        self.board = np.fromiter((int(x) for x in data if x.strip()), dtype=np.int8, count=81).reshape(9, 9)
         self.initial_board = self.board.copy()
 
-    def get_row(self, row, assigned=True):
-       """Returns the values in row `row`"""
-       a = self.board[row]
-       if assigned:
-        return a[a != 0]
-       return a[a == 0]
-
-    def get_col(self, col, assigned=True):
-        """Returns the values in column `col`""" 
-        a = self.board[:,col]
-        if assigned:
-            return a[a != 0]
-        return a[a == 0]
-
-    def get_9x9(self, pos, assigned=True):
-        """Returns the values in the 9x9 area in which the cell with position `pos` is""" 
-        row, col = pos
-        row_9x9, col_9x9 = int(row / 3), int(col / 3)
-
-        a = self.board[row_9x9*3:row_9x9*3+3, col_9x9*3:col_9x9*3+3].flatten()
-        if assigned:
-            return a[a != 0]
-        return a[a == 0]
-
-    def get_9x9_indices(self, pos_9x9, assigned=False):
-        """Returns the indices of the cells in a 9x9 area"""
-        if assigned:
-            return [(i,j) for i in range(pos_9x9[0]*3, pos_9x9[0]*3+3) for j in range(pos_9x9[1]*3, pos_9x9[1]*3+3) if self.board[i,j] != 0]
-        return [(i,j) for i in range(pos_9x9[0]*3, pos_9x9[0]*3+3) for j in range(pos_9x9[1]*3, pos_9x9[1]*3+3) if self.board[i,j] == 0]
-
-    def get_values(self, pos, assigned=True):
-        """Returns the values that the cell with position `pos` can/cannot take according to the current assigned values"""
-        return [i for i in range(1, 10) if i not in np.hstack((self.get_row(pos[0], assigned), self.get_col(pos[1], assigned), self.get_9x9(pos, assigned)))]
+        self.row_mask = np.zeros(9, dtype=np.uint16)
+        self.col_mask = np.zeros(9, dtype=np.uint16)
+        self.box_mask = np.zeros(9, dtype=np.uint16)
+        for i, j in zip(*np.nonzero(self.board)):
+            bit = 1 << (int(self.board[i,j]) - 1)
+            self.row_mask[i] |= bit
+            self.col_mask[j] |= bit
+            self.box_mask[(i // 3)*3 + j // 3] |= bit
+
+    def set_cell(self, row, col, value):
+        """Assigns `value` to the cell in (`row`, `col`) and marks it as used in its row, column and 9x9 area"""
+        bit = 1 << (value - 1)
+        self.board[row, col] = value
+        self.row_mask[row] ^= bit
+        self.col_mask[col] ^= bit
+        self.box_mask[(row // 3)*3 + col // 3] ^= bit
+
+    def clear_cell(self, row, col, value):
+        """Unassigns `value` from the cell in (`row`, `col`) and marks it as unused in its row, column and 9x9 area"""
+        bit = 1 << (value - 1)
+        self.board[row, col] = 0
+        self.row_mask[row] ^= bit
+        self.col_mask[col] ^= bit
+        self.box_mask[(row // 3)*3 + col // 3] ^= bit
+
+    def get_values_grid(self):
+        """Returns a 9x9 array with the bitmask of the values each unassigned cell can take, and 0 for the assigned cells"""
+        masks = ~(self.row_mask[:, None] | self.col_mask[None, :] | self.box_mask[BOX_INDEX]) & 0x1FF
+        masks[self.board != 0] = 0
+        return masks
 
     def get_unassigned_indices(self):
         """Returns the indices of the cells that have not been assigned a value yet"""
-        return [(i,j) for i in range(9) for j in range(9) if self.board[i,j] == 0]
+        return [tuple(index) for index in np.argwhere(self.board == 0).tolist()]
 
     def is_consistent(self):
-        """Returns  `True` if the sudoku is consistent `False`"""
-        for i, j in [(i,j) for i in range(9) for j in range(9) if self.board[i,j] != 0]:
-            value = self.board[i,j]
-            if value not in self.get_values((i,j), assigned=False):
-                return False
-        return True
+        """Returns `True` if no value is repeated in a row, column or 9x9 area else `False`"""
+        assigned = self.board != 0
+        counts = (assigned.sum(axis=1), assigned.sum(axis=0), assigned.reshape(3, 3, 3, 3).sum(axis=(1, 3)).ravel())
+        return all(int(mask).bit_count() == count for masks, unit_counts in zip((self.row_mask, self.col_mask, self.box_mask), counts) for mask, count in zip(masks, unit_counts))
 
     def is_complete(self):
         """Returns `True` if the sudoku is complete else `False`"""
-        return all(i != 0 for i in self.board.flatten())
+        return not (self.board == 0).any()
 
     def pretty_print(self):
         """Prints the sudoku board in the terminal"""
@@ -88,19 +99,19 @@ class Sudoku:
         img = Image.new(mode="RGBA", size=(SIZE, SIZE), color=background_color)
         draw = ImageDraw.Draw(img)
 
+        font = ImageFont.truetype("fonts/OpenSans-Regular.ttf", num_size)
+        sizes = {str(d): draw.textsize(str(d), font) for d in range(10)}
+        offsets = [k*cell_size + block_border*(k // 3 + 1) + k*cell_border for k in range(9)]
+
         for i, row in enumerate(self.board):
+            y0 = offsets[i]
             for j, col in enumerate(row):
-                draw.rectangle([
-                    j*cell_size + block_border*(int(j/3)+1) + j*cell_border, i*cell_size + block_border*(int(i/3)+1) + i*cell_border,
-                    (j+1)*cell_size + block_border*(int(j/3)+1) + j*cell_border, (i+1)*cell_size + block_border*(int(i/3)+1) + i*cell_border],
-                    cell_color)
-
-                font = ImageFont.truetype("fonts/OpenSans-Regular.ttf", num_size)
-                w, h = draw.textsize(str(col), font)
-                draw.text((
-                    j*cell_size + block_border*(int(j/3)+1) + j*cell_border + ((cell_size - w) / 2),
-                    i*cell_size + block_border*(int(i/3)+1) + i*cell_border + ((cell_size - h) / 4)),
-                str(col), fill=num_color if self.initial_board[i,j] == 0 else initial_num_color, font=font)        
+                x0 = offsets[j]
+                draw.rectangle([x0, y0, x0 + cell_size, y0 + cell_size], cell_color)
+
+                w, h = sizes[str(col)]
+                draw.text((x0 + ((cell_size - w) / 2), y0 + ((cell_size - h) / 4)),
+                str(col), fill=num_color if self.initial_board[i,j] == 0 else initial_num_color, font=font)
 
         img.save(file_name)
 
@@ -108,233 +119,177 @@ class Solver():
     def __init__(self, file_name):
         self.sudoku = Sudoku(file_name)
         self.candidates = dict()
+        self.dirty = set()
         self.solve()
 
     def update_candidates(self):
-        """Updates a dictionary mapping unassigned cells to the possible values they could take"""
-        if self.candidates:
-            self.candidates = {index:[i for i in self.sudoku.get_values(index) if i in self.candidates[index]] for index in self.sudoku.get_unassigned_indices()}
-        else:
-            self.candidates = {index:self.sudoku.get_values(index) for index in self.sudoku.get_unassigned_indices()}
-
-    def check_naked_single(self):
-        """Checks for naked singles and updates the board if one is found. Returns `True` if changes were made else `False`"""
-        revised = True
+        """Updates a dictionary mapping unassigned cells to a bitmask of the possible values they could take"""
+        candidates = dict()
+        masks = self.sudoku.get_values_grid()
+        for index in self.sudoku.get_unassigned_indices():
+            mask = int(masks[index])
+            if index in self.candidates:
+                mask &= self.candidates[index]
+            candidates[index] = mask
+        self.candidates = candidates
+
+    def mark(self, cell):
+        """Queues the row, column and 9x9 area of `cell` to be checked again"""
+        self.dirty.update(CELL_UNITS[cell])
+
+    def assign(self, cell, value):
+        """Assigns `value` to `cell` and removes it from the candidates of its peers"""
+        candidates = self.candidates
+        self.sudoku.set_cell(*cell, value)
+        candidates.pop(cell)
+        self.mark(cell)
+        bit = 1 << (value - 1)
+        for peer in PEERS[cell]:
+            if peer in candidates and candidates[peer] & bit:
+                candidates[peer] &= ~bit
+                self.mark(peer)
+
+    def naked_singles(self, unit):
+        """Assigns the cells in `unit` that have a single candidate left. Returns `True` if changes were made else `False`"""
+        candidates = self.candidates
         changes_made = False
-        while revised:
-            revised = False
-            for index, candidate in self.candidates.items():
-                if len(candidate) == 1:
-                    self.sudoku.board[index[0], index[1]] = candidate[0]
-                    self.update_candidates()
-                    revised = True
-                    changes_made = True
-            self.update_candidates()
-
+        for cell in unit:
+            if cell in candidates and candidates[cell].bit_count() == 1:
+                self.assign(cell, candidates[cell].bit_length())
+                changes_made = True
         return changes_made
 
-    def check_hidden_single(self):
-        """Checks for hidden singles and updates the board if one is found. Returns `True` if changes were made else `False`"""
-        revised = True
+    def hidden_singles(self, unit):
+        """Assigns the values that can only go in one cell of `unit`. Returns `True` if changes were made else `False`"""
+        candidates = self.candidates
         changes_made = False
-
-        def check_hidden(cells):
-            in_revised = False
-            check = {i:list() for i in range(1,10)}
-            for cell in cells:
-                for d in self.candidates[cell]:
-                    check[d].append(cell)
-            for key, value in check.items():
-                if len(value) == 1 and value[0] in self.candidates.keys():
-                    self.sudoku.board[value[0]] = key
-                    self.candidates.pop(value[0])
-                    self.update_candidates()
-                    in_revised = True
-            return in_revised
-        
-        while revised:
-            revised = False
-            for area_9x9 in [(i,j) for i in range(3) for j in range(3)]:
-                revised = False if not check_hidden(self.sudoku.get_9x9_indices(area_9x9)) and not revised else True
-            for i in range(9):
-                revised = False if not check_hidden([(i, j) for j in range(9) if self.sudoku.board[i,j] == 0]) and not revised else True
-                revised = False if not check_hidden([(j, i) for j in range(9) if self.sudoku.board[j,i] == 0]) and not revised else True
-            if revised:
+        for d in range(9):
+            cells = [c for c in unit if c in candidates and candidates[c] >> d & 1]
+            if len(cells) == 1:
+                self.assign(cells[0], d + 1)
                 changes_made = True
         return changes_made
 
-    def check_naked_candidates(self, n):
-        """Checks for naked pairs and updates the candidates is one is found. Returns `True` if changes were made else `False`"""
-        revised = True
+    def naked_subsets(self, unit, n):
+        """Removes the values of every naked subset of `n` cells in `unit` from the other cells. Returns `True` if changes were made else `False`"""
+        candidates = self.candidates
         changes_made = False
-
-        def check_naked(cells):
-            in_revised = False
-            for cell in cells:
-                if len(self.candidates[cell]) != n:
-                    continue
-                cells_with_same_candidate = self.get_cells_with_candidate(self.candidates[cell], cells)
-                if len(cells_with_same_candidate) == n:
-                    for c in [i for i in cells if i not in cells_with_same_candidate]:
-                        for to_remove in self.candidates[cell]:
-                            try:
-                                self.candidates[c].remove(to_remove)
-                                in_revised = True
-                            except:
-                                pass
-            return in_revised
-
-        while revised:
-            revised = False
-            for area_9x9 in [(i,j) for i in range(3) for j in range(3)]:
-                revised = False if not check_naked(self.sudoku.get_9x9_indices(area_9x9)) and not revised else True
-            for i in range(9):
-                revised = False if not check_naked([(i, j) for j in range(9) if self.sudoku.board[i,j] == 0]) and not revised else True
-                revised = False if not check_naked([(j, i) for j in range(9) if self.sudoku.board[j,i] == 0]) and not revised else True
-            if revised:
-                changes_made = True
+        cells = [c for c in unit if c in candidates and candidates[c]]
+        for subset in itertools.combinations(cells, n):
+            union = functools.reduce(operator.or_, (candidates[c] for c in subset))
+            if union.bit_count() != n:
+                continue
+            for other in cells:
+                if other not in subset and candidates[other] & union:
+                    candidates[other] &= ~union
+                    self.mark(other)
+                    changes_made = True
         return changes_made
 
-    def check_hidden_candidates(self, n):
-        """Checks for hidden pairs and updates the candidates if one is found. Returns `True` if changes were made else `False`"""
-        revised = True
+    def hidden_subsets(self, unit, n):
+        """Restricts the cells of every hidden subset of `n` values in `unit` to those values. Returns `True` if changes were made else `False`"""
+        candidates = self.candidates
         changes_made = False
-
-        def check_hidden(cells):
-            in_revised = False
-            check = {i:set() for i in itertools.combinations(range(1,10), n)}
-            for combination in check.items():
-                for cell in cells:
-                    if any(True if i in self.candidates[cell] else False for i in combination[0]):
-                        check[combination[0]].add(cell)
-
-            for combination, c in check.items():
-                if len(c) == n and len(set([j for i in c for j in self.candidates[i] if j in combination])) == n:
-                    for cell in c:
-                        a = sorted(self.candidates[cell])
-                        self.candidates[cell] = [i for i in self.candidates[cell] if i in combination]
-                        if a != sorted(self.candidates[cell]):
-                            in_revised = True
-            return in_revised
-
-        while revised:
-            revised = False
-            for area_9x9 in [(i,j) for i in range(3) for j in range(3)]:
-                revised = False if not check_hidden(self.sudoku.get_9x9_indices(area_9x9)) and not revised else True
-            for i in range(9):
-                revised = False if not check_hidden([(i, j) for j in range(9) if self.sudoku.board[i,j] == 0]) and not revised else True
-                revised = False if not check_hidden([(j, i) for j in range(9) if self.sudoku.board[j,i] == 0]) and not revised else True
-            if revised:
-                changes_made = True
-    
+        cells = [c for c in unit if c in candidates]
+        positions = [sum(1 << i for i, c in enumerate(cells) if candidates[c] >> d & 1) for d in range(9)]
+        for subset in itertools.combinations([d for d in range(9) if positions[d]], n):
+            union = functools.reduce(operator.or_, (positions[d] for d in subset))
+            if union.bit_count() != n:
+                continue
+            values = sum(1 << d for d in subset)
+            for i, c in enumerate(cells):
+                if union >> i & 1 and candidates[c] & ~values:
+                    candidates[c] &= values
+                    self.mark(c)
+                    changes_made = True
         return changes_made
 
-    def check_all_pointing(self):
-        """Checks for pointing pairs and triples and updates the board if one is found. Returns `True` if changes were made else `False`"""
-        revised = True
+    def pointing(self, unit):
+        """Checks for pointing pairs and triples and box/line reductions in `unit`: if all the cells of a value lie in another
+        unit, the value is removed from the rest of that unit. Returns `True` if changes were made else `False`"""
+        candidates = self.candidates
         changes_made = False
-
-        def check_pointing(cells):
-            in_revised = False
-            check = {i:{"rows":set(), "cols":set()} for i in range(1, 10)}
-            check_candidate = {i:set() for i in range(1, 10)}
-            for cell in cells:
-                for d in self.candidates[cell]:
-                    check[d]["rows"].add(cell[0])
-                    check[d]["cols"].add(cell[1])
-                    check_candidate[d].add(cell)
-            tmp = ("rows", "cols")
-            for i in range(2):
-                for d, row_cols in check.items():
-                    if not row_cols[tmp[i]]:
-                        continue
-                    if len(row_cols[tmp[i]]) == 1:
-                        rc = row_cols[tmp[i]].pop()
-                        if i == 0:
-                            for j in range(9):
-                                if (rc, j) in self.candidates.keys() and (rc, j) not in cells:
-                                    try:
-                                        self.candidates[rc, j].remove(d)
-                                        in_revised = True
-                                    except:
-                                        pass
-                            if len(set([int(k[1] / 3) for k in check_candidate[d] if k[0] == rc])) == 1:
-                                pointing_cells = [k for k in check_candidate[d] if k[0] == rc]
-                                for c in self.sudoku.get_9x9_indices((int(rc / 3), int(pointing_cells[0][1] / 3))):
-                                    if c not in pointing_cells:
-                                        try:
-                                            self.candidates[c].remove(d)
-                                            in_revised = True
-                                        except:
-                                            pass
-
-                        else:
-                            for j in range(9):
-                                if (j, rc) in self.candidates.keys() and (j, rc) not in cells:
-                                    try:
-                                        self.candidates[j, rc].remove(d)
-                                        in_revised = True
-                                    except:
-                                        pass
-
-                            if len(set([int(k[0] / 3) for k in check_candidate[d] if k[1] == rc])) == 1:
-                                pointing_cells = [k for k in check_candidate[d] if k[1] == rc]
-                                for c in self.sudoku.get_9x9_indices((int(pointing_cells[0][0] / 3), int(rc / 3))):
-                                    if c not in pointing_cells:
-                                        try:
-                                            self.candidates[c].remove(d)
-                                            in_revised = True
-                                        except:
-                                            pass
-                        
-            return in_revised
-
-        while revised:
-            revised = False
-            for i in range(9):
-                revised = False if not check_pointing([(i, j) for j in range(9) if self.sudoku.board[i,j] == 0]) and not revised else True
-                revised = False if not check_pointing([(j, i) for j in range(9) if self.sudoku.board[j,i] == 0]) and not revised else True
-            if revised:
-                changes_made = True
+        for d in range(9):
+            bit = 1 << d
+            cells = [c for c in unit if c in candidates and candidates[c] & bit]
+            if len(cells) < 2:
+                continue
+            others = set()
+            if len({r for r, _ in cells}) == 1:
+                others.update(ROWS[cells[0][0]])
+            if len({c for _, c in cells}) == 1:
+                others.update(COLS[cells[0][1]])
+            if len({(r // 3)*3 + c // 3 for r, c in cells}) == 1:
+                others.update(BOXES[(cells[0][0] // 3)*3 + cells[0][1] // 3])
+            for c in others.difference(cells):
+                if c in candidates and candidates[c] & bit:
+                    candidates[c] &= ~bit
+                    self.mark(c)
+                    changes_made = True
         return changes_made
 
-    def check_all_hidden(self):
-        """Checks for hidden singles, pairs, triples, quad. Returns `True` if changes were made else `False`"""
-        changes_made = []
-        changes_made.append(self.check_hidden_single())
-        for i in range(2,5):
-            changes_made.append(self.check_hidden_candidates(i))
-
-        return any(changes_made)
-
-    def check_all_naked(self):
-        """Checks for naked singles, pairs, triples, quad. Returns `True` if changes were made else `False`"""
-        changes_made = []
-        changes_made.append(self.check_naked_single())
-        for i in range(2,5):
-            changes_made.append(self.check_naked_candidates(i))
-
-        return any(changes_made)
-
-    def get_cells_with_candidate(self, candidate, cells):
-        """Returns the cells with candidate `candidate` in `cells`"""
-        same_cells = []
-        for cell in cells:
-            if cell in self.candidates.keys() and self.candidates[cell] == candidate:
-                same_cells.append(cell)
-
-        return same_cells
-        
+    def propagate(self):
+        """Runs every technique over the queued rows, columns and 9x9 areas until no unit is left to check"""
+        while self.dirty:
+            unit = UNITS[self.dirty.pop()]
+            self.naked_singles(unit)
+            self.hidden_singles(unit)
+            for n in range(2, 5):
+                self.naked_subsets(unit, n)
+                self.hidden_subsets(unit, n)
+            self.pointing(unit)
+
+    def is_viable(self):
+        """Returns `False` if a cell has no candidates left or a value has no cell left in a unit else `True`"""
+        candidates = self.candidates
+        if not all(candidates.values()):
+            return False
+        assigned = [*self.sudoku.row_mask, *self.sudoku.col_mask, *self.sudoku.box_mask]
+        for unit, mask in zip(UNITS, assigned):
+            mask = int(mask)
+            for cell in unit:
+                if cell in candidates:
+                    mask |= candidates[cell]
+            if mask != 0x1FF:
+                return False
+        return True
+
+    def propagate_singles(self):
+        """Assigns naked singles until none are left. Returns `False` if the sudoku stops being viable else `True`"""
+        while True:
+            if not self.is_viable():
+                return False
+            singles = [cell for cell, mask in self.candidates.items() if mask.bit_count() == 1]
+            if not singles:
+                return True
+            for cell in singles:
+                if cell in self.candidates and self.candidates[cell]:
+                    self.assign(cell, self.candidates[cell].bit_length())
+
+    def backtrack(self):
+        """Assigns the remaining cells by trying the candidates of the cell with the fewest of them first.
+        Returns `True` if a solution was found else `False`"""
+        if not self.candidates:
+            return True
+        cell = min(self.candidates, key=lambda c: self.candidates[c].bit_count())
+        for value in get_mask_values(self.candidates[cell]):
+            candidates = dict(self.candidates)
+            self.assign(cell, value)
+            if self.propagate_singles() and self.backtrack():
+                return True
+            for c in candidates.keys() - self.candidates.keys():
+                self.sudoku.clear_cell(*c, int(self.sudoku.board[c]))
+            self.candidates = candidates
+        return False
+
     def solve(self):
         """Solves the sudoku if it has a solution"""
-        changes = [True]
-        while any(changes):
-            changes = []
-            changes.extend([
-                self.check_all_naked(),
-                self.check_all_hidden(),
-                self.check_all_pointing()
-            ])
+        if self.sudoku.is_consistent():
+            self.update_candidates()
+            self.dirty = set(range(len(UNITS)))
+            self.propagate()
+            if not self.sudoku.is_complete() and self.propagate_singles():
+                self.backtrack()
 
         if self.sudoku.is_complete() and self.sudoku.is_consistent():
             print("Solution Found")
@@ -342,7 +297,7 @@ class Solver():
             self.sudoku.output_img()
 
         else:
-            print("The current version of the program cannot solve the sudoku")
+            print("The sudoku has no solution")
 
 a = time.time_ns()
 s = Solver("sudokus/sudoku3.txt")